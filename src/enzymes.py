@@ -6,6 +6,9 @@
 
 import os
 import sys
+import math
+import json
+import hashlib
 import urllib
 import types
 import re
@@ -69,6 +72,48 @@ import bag
 # brenda_organism (oid INT, name TEXT)
 #     <oid>     - the ID of the organism
 #     name      - the name of the organism
+#
+#
+# haldane_check (rid INT, log_kcat_ratio REAL, log_km_ratio REAL, log_keq REAL,
+#                km_left INT, numsubs_left INT, km_right INT, numsubs_right INT)
+#     <rid>     - the ID of the reaction according to KEGG
+#     log_kcat_ratio - log10(kcat(left->right) / kcat(right->left))
+#     log_km_ratio   - log10(prod(Km_right^coeff) / prod(Km_left^coeff))
+#     log_keq   - the equilibrium constant implied by the Haldane relationship (log10),
+#                 only meaningful if all the substrates on both sides have a Km
+#     km_left   - the number of substrates (with stoichiometry) on the left side that have a Km
+#     numsubs_left - the number of substrates on the left side (as in kegg_rid_to_numsubs)
+#     km_right, numsubs_right - same for the right side
+#
+# haldane_outlier (rid INT, log_keq REAL)
+#     <rid>     - the ID of the reaction according to KEGG
+#     log_keq   - the implied log10(Keq), which is outside the allowed bounds
+#     * only reactions with a Km for all the substrates on both sides are checked
+#
+# imputed_km (rid INT, side INT, cid INT, organism TEXT, value REAL, log_mean REAL, log_std REAL, count INT, source TEXT)
+#     <rid, side, cid, organism>
+#     rid       - the ID of the reaction according to KEGG
+#     side      - (-1) if this compound is on the left side, (+1) on the right
+#     cid       - the ID of the compound according to KEGG
+#     organism  - the organism for this estimate, or NULL if it is not organism specific
+#     value     - the estimated Km (10^log_mean)
+#     log_mean  - the mean log10 value of the neighbors
+#     log_std   - the sample standard deviation (n-1) of the log10 values of the neighbors,
+#                 or NULL if there is only one neighbor (i.e. the uncertainty is unknown)
+#     count     - the number of neighbors used for the estimate
+#     source    - the type of neighbors, e.g. 'ec3_cid' for the same compound in
+#                 reactions sharing the first 3 levels of the EC number
+#
+# imputed_tn (rid INT, side INT, cid INT, organism TEXT, value REAL, log_mean REAL, log_std REAL, count INT, source TEXT)
+#     * the same as imputed_km, for the turnover numbers
+#
+# kegg_module_bundle (mid INT, digest TEXT, bundle TEXT)
+#     <mid>     - the ID of the module in KEGG
+#     digest    - MD5 of the content of the bundle, used to regenerate only the modules that changed
+#     bundle    - a JSON object with the name of the module and a list of its reactions, each with
+#                 its EC, stoichiometry (side, coefficient, cid), measured Km and kcat values
+#                 (side, cid, organism, pubid, value) and imputed ones (side, cid, value, log_std, source)
+#     * unlike the other tables, this one is kept between runs
 
 class Common:
     @staticmethod
@@ -84,6 +129,17 @@ class Common:
             return unicode(s)
         except UnicodeDecodeError:
             return u"?"
+
+    @staticmethod
+    def register_math_functions(comm):
+        """
+            Add the math functions which are missing in SQLite, so that the
+            aggregations over the parameter tables can be done in SQL
+            instead of in python loops.
+        """
+        comm.create_function("log10", 1, math.log10)
+        comm.create_function("exp10", 1, lambda x: 10.0 ** x)
+        comm.create_function("sqrt", 1, math.sqrt)
             
 class KeggParseException(Exception):
     def __init__(self, value):
@@ -504,6 +560,362 @@ class Brenda:
                 results.append((field, organism_id, k, cannonic_name, pubid))
         return results
         
+class Haldane:
+    def __init__(self, comm, log_file=None):
+        """
+            Check that the Km and kcat values of both sides of each reaction
+            are consistent with the Haldane relationship:
+            
+            Keq = (kcat_f / kcat_r) * prod(Km_right^coeff) / prod(Km_left^coeff)
+            
+            All values are averaged (in log-scale) over organisms and
+            publications, and the implied Keq is calculated for all reactions
+            at once. Reactions where it is out of bounds are written to
+            haldane_outlier, but only if all the substrates on both sides
+            have a Km (otherwise the products are missing terms).
+        """
+        if (log_file != None):
+            self.LOG_FILE = log_file
+        else:
+            self.LOG_FILE = sys.stderr
+        
+        # the maximal allowed |log10(Keq)|, Km values are in mM and kcat in 1/s
+        self.LOG_KEQ_BOUND = 10.0
+        
+        Common.register_math_functions(comm)
+        c = comm.cursor()
+        self.LOG_FILE.write("Checking the Haldane relationship for all reactions ... ")
+
+        # the mean log(Km) of each compound in each reaction, weighted by its coefficient
+        c.execute("DROP TABLE IF EXISTS haldane_km_temp")
+        c.execute("CREATE TABLE haldane_km_temp (rid INT, side INT, cid INT, coefficient INT, log_km REAL)")
+        c.execute("INSERT INTO haldane_km_temp SELECT k.rid, k.side, k.cid, r2c.coefficient, AVG(log10(k.value)) " + 
+                  "FROM merged_km k, kegg_rid_to_cid r2c WHERE k.rid=r2c.rid and k.side=r2c.side and k.cid=r2c.cid and k.value > 0 " +
+                  "GROUP BY k.rid, k.side, k.cid")
+
+        c.execute("DROP TABLE IF EXISTS haldane_side_temp")
+        c.execute("CREATE TABLE haldane_side_temp (rid INT, side INT, log_km REAL, km_count INT)")
+        c.execute("INSERT INTO haldane_side_temp SELECT rid, side, SUM(coefficient * log_km), SUM(coefficient) " +
+                  "FROM haldane_km_temp GROUP BY rid, side")
+        c.execute("DROP INDEX IF EXISTS haldane_side_idx")
+        c.execute("CREATE UNIQUE INDEX haldane_side_idx ON haldane_side_temp (rid, side)")
+
+        # the mean log(kcat) of each side of each reaction
+        c.execute("DROP TABLE IF EXISTS haldane_kcat_temp")
+        c.execute("CREATE TABLE haldane_kcat_temp (rid INT, side INT, log_kcat REAL)")
+        c.execute("INSERT INTO haldane_kcat_temp SELECT rid, side, AVG(log10(value)) FROM merged_tn WHERE value > 0 GROUP BY rid, side")
+        c.execute("DROP INDEX IF EXISTS haldane_kcat_idx")
+        c.execute("CREATE UNIQUE INDEX haldane_kcat_idx ON haldane_kcat_temp (rid, side)")
+        comm.commit()
+
+        c.execute("DROP TABLE IF EXISTS haldane_check")
+        c.execute("CREATE TABLE haldane_check (rid INT, log_kcat_ratio REAL, log_km_ratio REAL, log_keq REAL, " +
+                  "km_left INT, numsubs_left INT, km_right INT, numsubs_right INT)")
+        c.execute("INSERT INTO haldane_check SELECT l.rid, tl.log_kcat - tr.log_kcat, r.log_km - l.log_km, " +
+                  "(tl.log_kcat - tr.log_kcat) + (r.log_km - l.log_km), l.km_count, nl.numsubs, r.km_count, nr.numsubs " +
+                  "FROM haldane_side_temp l, haldane_side_temp r, haldane_kcat_temp tl, haldane_kcat_temp tr, " +
+                  "kegg_rid_to_numsubs nl, kegg_rid_to_numsubs nr " +
+                  "WHERE l.side=-1 and r.side=1 and l.rid=r.rid and tl.rid=l.rid and tl.side=-1 and tr.rid=l.rid and tr.side=1 " + 
+                  "and nl.rid=l.rid and nl.side=-1 and nr.rid=l.rid and nr.side=1")
+        c.execute("DROP INDEX IF EXISTS haldane_check_idx")
+        c.execute("CREATE UNIQUE INDEX haldane_check_idx ON haldane_check (rid)")
+
+        c.execute("DROP TABLE IF EXISTS haldane_outlier")
+        c.execute("CREATE TABLE haldane_outlier (rid INT, log_keq REAL)")
+        c.execute("INSERT INTO haldane_outlier SELECT rid, log_keq FROM haldane_check " +
+                  "WHERE km_left=numsubs_left and km_right=numsubs_right and ABS(log_keq) > ?", (self.LOG_KEQ_BOUND,))
+        c.execute("DROP INDEX IF EXISTS haldane_outlier_idx")
+        c.execute("CREATE UNIQUE INDEX haldane_outlier_idx ON haldane_outlier (rid)")
+
+        c.execute("DROP TABLE haldane_km_temp")
+        c.execute("DROP TABLE haldane_side_temp")
+        c.execute("DROP TABLE haldane_kcat_temp")
+        comm.commit()
+        c.close()
+        self.LOG_FILE.write("[DONE]\n")
+
+class Imputation:
+    def __init__(self, comm, log_file=None):
+        """
+            Estimate the Km and kcat values which are missing for the
+            (rid, side, cid) triplets in kegg_rid_to_cid, using the values
+            of their neighbors. The neighbors are taken from the most
+            specific group which has any data, in this order:
+            the same compound in reactions with the same EC (4 levels down to 1),
+            the same compound in any reaction, any compound with the same EC
+            (4 levels down to 1), and finally all the data.
+            
+            The same is done for each organism separately (using only its own
+            data), for the compounds of reactions which were measured in that
+            organism, but not with this compound.
+            
+            The EC group of a reaction (for each level) is the union of the
+            reactions sharing any of its EC prefixes, so reactions with several
+            EC numbers are grouped by their combination of prefixes. Each group
+            is aggregated only once over its distinct observations (count, sum
+            and sum of squares of the log10 values), and all the missing values
+            are filled in together for each group type.
+        """
+        if (log_file != None):
+            self.LOG_FILE = log_file
+        else:
+            self.LOG_FILE = sys.stderr
+        
+        self.EC_LEVELS = [4, 3, 2, 1]
+        
+        Common.register_math_functions(comm)
+        c = comm.cursor()
+        self.LOG_FILE.write("Building the EC index for the imputation ... ")
+        
+        # an inverted index from each EC prefix (e.g. '1.1.1' for level 3) to the reactions
+        c.execute("DROP TABLE IF EXISTS imputation_ec_temp")
+        c.execute("CREATE TABLE imputation_ec_temp (rid INT, level INT, prefix TEXT)")
+        rid_level_prefix_set = set()
+        for (rid, ec) in c.execute("SELECT rid, ec FROM kegg_rid_to_ec").fetchall():
+            tokens = ec.split('.')
+            for level in self.EC_LEVELS:
+                if (len(tokens) < level or '-' in tokens[0:level]):
+                    continue
+                rid_level_prefix_set.add((rid, level, '.'.join(tokens[0:level])))
+        c.executemany("INSERT INTO imputation_ec_temp VALUES(?,?,?)", sorted(rid_level_prefix_set))
+        c.execute("DROP INDEX IF EXISTS imputation_ec_rid_idx")
+        c.execute("CREATE UNIQUE INDEX imputation_ec_rid_idx ON imputation_ec_temp (rid, level, prefix)")
+        c.execute("DROP INDEX IF EXISTS imputation_ec_prefix_idx")
+        c.execute("CREATE INDEX imputation_ec_prefix_idx ON imputation_ec_temp (level, prefix)")
+        
+        # the key of each reaction's EC group is its ';'-separated list of prefixes (for each level),
+        # which is the prefix itself for reactions with a single one
+        rid_level_to_prefixes = {}
+        for (rid, level, prefix) in rid_level_prefix_set:
+            rid_level_to_prefixes.setdefault((rid, level), []).append(prefix)
+        c.execute("DROP TABLE IF EXISTS imputation_eckey_temp")
+        c.execute("CREATE TABLE imputation_eckey_temp (rid INT, level INT, key TEXT)")
+        c.execute("DROP TABLE IF EXISTS imputation_eckey_prefix_temp")
+        # only the keys with more than one prefix (the groups of the others are the same as their prefix)
+        c.execute("CREATE TABLE imputation_eckey_prefix_temp (level INT, key TEXT, prefix TEXT)")
+        key_prefix_set = set()
+        for ((rid, level), prefixes) in sorted(rid_level_to_prefixes.items()):
+            key = ';'.join(sorted(prefixes))
+            c.execute("INSERT INTO imputation_eckey_temp VALUES(?,?,?)", (rid, level, key))
+            for prefix in prefixes:
+                key_prefix_set.add((level, key, prefix))
+        c.executemany("INSERT INTO imputation_eckey_prefix_temp VALUES(?,?,?)", sorted([x for x in key_prefix_set if ';' in x[1]]))
+        c.execute("DROP INDEX IF EXISTS imputation_eckey_rid_idx")
+        c.execute("CREATE UNIQUE INDEX imputation_eckey_rid_idx ON imputation_eckey_temp (rid, level)")
+        comm.commit()
+        self.LOG_FILE.write("[DONE]\n")
+
+        self.impute(comm, 'merged_km', 'imputed_km')
+        self.impute(comm, 'merged_tn', 'imputed_tn')
+
+        c.execute("DROP TABLE imputation_ec_temp")
+        c.execute("DROP TABLE imputation_eckey_temp")
+        c.execute("DROP TABLE imputation_eckey_prefix_temp")
+        comm.commit()
+        c.close()
+
+    def impute(self, comm, param_table, imputed_table):
+        self.LOG_FILE.write("Imputing the missing values of " + param_table + " into " + imputed_table + " ... ")
+        c = comm.cursor()
+
+        c.execute("DROP TABLE IF EXISTS " + imputed_table)
+        c.execute("CREATE TABLE " + imputed_table + " (rid INT, side INT, cid INT, organism TEXT, value REAL, " +
+                  "log_mean REAL, log_std REAL, count INT, source TEXT)")
+        # needed before the tiers are filled, for removing the targets which were already imputed
+        c.execute("DROP INDEX IF EXISTS " + imputed_table + "_idx")
+        c.execute("CREATE UNIQUE INDEX " + imputed_table + "_idx ON " + imputed_table + " (rid, side, cid, organism)")
+
+        # the observed values (log-scale), per organism and averaged over organisms
+        c.execute("DROP TABLE IF EXISTS imputation_org_obs_temp")
+        c.execute("CREATE TABLE imputation_org_obs_temp (rid INT, side INT, cid INT, organism TEXT, x REAL)")
+        c.execute("INSERT INTO imputation_org_obs_temp SELECT rid, side, cid, organism, AVG(log10(value)) " +
+                  "FROM " + param_table + " WHERE value > 0 GROUP BY rid, side, cid, organism")
+        c.execute("CREATE UNIQUE INDEX imputation_org_obs_idx ON imputation_org_obs_temp (rid, side, cid, organism)")
+
+        c.execute("DROP TABLE IF EXISTS imputation_obs_temp")
+        c.execute("CREATE TABLE imputation_obs_temp (rid INT, side INT, cid INT, x REAL)")
+        c.execute("INSERT INTO imputation_obs_temp SELECT rid, side, cid, AVG(x) FROM imputation_org_obs_temp GROUP BY rid, side, cid")
+        c.execute("CREATE UNIQUE INDEX imputation_obs_idx ON imputation_obs_temp (rid, side, cid)")
+
+        # the aggregated values of each neighbor group. Each observation is counted once per EC group,
+        # so the groups of several prefixes are aggregated over their distinct observations.
+        c.execute("DROP TABLE IF EXISTS imputation_ec_cid_temp")
+        c.execute("CREATE TABLE imputation_ec_cid_temp (level INT, key TEXT, cid INT, n INT, s1 REAL, s2 REAL)")
+        c.execute("INSERT INTO imputation_ec_cid_temp SELECT e.level, e.prefix, o.cid, COUNT(*), SUM(o.x), SUM(o.x * o.x) " +
+                  "FROM imputation_obs_temp o, imputation_ec_temp e WHERE e.rid=o.rid GROUP BY e.level, e.prefix, o.cid")
+        c.execute("INSERT INTO imputation_ec_cid_temp SELECT level, key, cid, COUNT(*), SUM(x), SUM(x * x) " +
+                  "FROM (SELECT DISTINCT kp.level, kp.key, o.rid, o.side, o.cid, o.x FROM imputation_eckey_prefix_temp kp, " +
+                  "imputation_ec_temp e, imputation_obs_temp o WHERE e.level=kp.level and e.prefix=kp.prefix and o.rid=e.rid) " +
+                  "GROUP BY level, key, cid")
+        c.execute("CREATE UNIQUE INDEX imputation_ec_cid_idx ON imputation_ec_cid_temp (level, key, cid)")
+
+        c.execute("DROP TABLE IF EXISTS imputation_cid_temp")
+        c.execute("CREATE TABLE imputation_cid_temp (cid INT, n INT, s1 REAL, s2 REAL)")
+        c.execute("INSERT INTO imputation_cid_temp SELECT cid, COUNT(*), SUM(x), SUM(x * x) FROM imputation_obs_temp GROUP BY cid")
+        c.execute("CREATE UNIQUE INDEX imputation_cid_idx ON imputation_cid_temp (cid)")
+
+        c.execute("DROP TABLE IF EXISTS imputation_ec_only_temp")
+        c.execute("CREATE TABLE imputation_ec_only_temp (level INT, key TEXT, n INT, s1 REAL, s2 REAL)")
+        c.execute("INSERT INTO imputation_ec_only_temp SELECT level, key, SUM(n), SUM(s1), SUM(s2) " +
+                  "FROM imputation_ec_cid_temp GROUP BY level, key")
+        c.execute("CREATE UNIQUE INDEX imputation_ec_only_idx ON imputation_ec_only_temp (level, key)")
+
+        c.execute("DROP TABLE IF EXISTS imputation_org_ec_cid_temp")
+        c.execute("CREATE TABLE imputation_org_ec_cid_temp (organism TEXT, level INT, key TEXT, cid INT, n INT, s1 REAL, s2 REAL)")
+        c.execute("INSERT INTO imputation_org_ec_cid_temp SELECT o.organism, e.level, e.prefix, o.cid, COUNT(*), SUM(o.x), SUM(o.x * o.x) " +
+                  "FROM imputation_org_obs_temp o, imputation_ec_temp e WHERE e.rid=o.rid GROUP BY o.organism, e.level, e.prefix, o.cid")
+        c.execute("INSERT INTO imputation_org_ec_cid_temp SELECT organism, level, key, cid, COUNT(*), SUM(x), SUM(x * x) " +
+                  "FROM (SELECT DISTINCT kp.level, kp.key, o.organism, o.rid, o.side, o.cid, o.x FROM imputation_eckey_prefix_temp kp, " +
+                  "imputation_ec_temp e, imputation_org_obs_temp o WHERE e.level=kp.level and e.prefix=kp.prefix and o.rid=e.rid) " +
+                  "GROUP BY organism, level, key, cid")
+        c.execute("CREATE UNIQUE INDEX imputation_org_ec_cid_idx ON imputation_org_ec_cid_temp (organism, level, key, cid)")
+
+        c.execute("DROP TABLE IF EXISTS imputation_org_cid_temp")
+        c.execute("CREATE TABLE imputation_org_cid_temp (organism TEXT, cid INT, n INT, s1 REAL, s2 REAL)")
+        c.execute("INSERT INTO imputation_org_cid_temp SELECT organism, cid, COUNT(*), SUM(x), SUM(x * x) " + 
+                  "FROM imputation_org_obs_temp GROUP BY organism, cid")
+        c.execute("CREATE UNIQUE INDEX imputation_org_cid_idx ON imputation_org_cid_temp (organism, cid)")
+        comm.commit()
+
+        # the (rid, side, cid) which have no value in any organism
+        c.execute("DROP TABLE IF EXISTS imputation_target_temp")
+        c.execute("CREATE TABLE imputation_target_temp (rid INT, side INT, cid INT, organism TEXT)")
+        c.execute("INSERT INTO imputation_target_temp SELECT DISTINCT r2c.rid, r2c.side, r2c.cid, NULL " +
+                  "FROM kegg_rid_to_cid r2c LEFT JOIN imputation_obs_temp o " +
+                  "ON o.rid=r2c.rid and o.side=r2c.side and o.cid=r2c.cid WHERE o.rid IS NULL")
+        c.execute("CREATE INDEX imputation_target_idx ON imputation_target_temp (rid, side, cid)")
+        
+        tier_list = []
+        for level in self.EC_LEVELS:
+            tier_list.append(('ec%d_cid' % level, "imputation_eckey_temp k, imputation_ec_cid_temp s",
+                              "k.rid=t.rid and k.level=%d and s.level=k.level and s.key=k.key and s.cid=t.cid" % level))
+        tier_list.append(('cid', "imputation_cid_temp s", "s.cid=t.cid"))
+        for level in self.EC_LEVELS:
+            tier_list.append(('ec%d' % level, "imputation_eckey_temp k, imputation_ec_only_temp s",
+                              "k.rid=t.rid and k.level=%d and s.level=k.level and s.key=k.key" % level))
+        tier_list.append(('all', "(SELECT COUNT(*) n, SUM(x) s1, SUM(x * x) s2 FROM imputation_obs_temp) s", "s.n > 0"))
+        self.fill_targets(c, imputed_table, tier_list)
+
+        # the (rid, side, cid) which have no value in an organism that has values for other compounds of that reaction
+        c.execute("DELETE FROM imputation_target_temp")
+        c.execute("INSERT INTO imputation_target_temp SELECT r2c.rid, r2c.side, r2c.cid, o.organism " +
+                  "FROM (SELECT DISTINCT rid, organism FROM imputation_org_obs_temp) o, " +
+                  "(SELECT DISTINCT rid, side, cid FROM kegg_rid_to_cid) r2c WHERE r2c.rid=o.rid and NOT EXISTS " +
+                  "(SELECT 1 FROM imputation_org_obs_temp x WHERE x.rid=r2c.rid and x.side=r2c.side and x.cid=r2c.cid and x.organism=o.organism)")
+
+        tier_list = []
+        for level in self.EC_LEVELS:
+            tier_list.append(('organism_ec%d_cid' % level, "imputation_eckey_temp k, imputation_org_ec_cid_temp s",
+                              "k.rid=t.rid and k.level=%d and s.organism=t.organism and s.level=k.level and s.key=k.key and s.cid=t.cid" % level))
+        tier_list.append(('organism_cid', "imputation_org_cid_temp s", "s.organism=t.organism and s.cid=t.cid"))
+        self.fill_targets(c, imputed_table, tier_list)
+
+        for table in ['imputation_org_obs_temp', 'imputation_obs_temp', 'imputation_ec_cid_temp', 'imputation_cid_temp',
+                      'imputation_ec_only_temp', 'imputation_org_ec_cid_temp', 'imputation_org_cid_temp', 'imputation_target_temp']:
+            c.execute("DROP TABLE " + table)
+        comm.commit()
+        c.close()
+        self.LOG_FILE.write("[DONE]\n")
+
+    def fill_targets(self, c, imputed_table, tier_list):
+        """
+            For each tier (source name, FROM clause and join condition of the
+            aggregated neighbor group 's' to the target 't', which must match
+            at most one group per target), add the estimates for all the
+            remaining targets which have such neighbors, and remove them from
+            imputation_target_temp.
+        """
+        for (source, from_clause, where_clause) in tier_list:
+            c.execute("INSERT INTO " + imputed_table + " SELECT t.rid, t.side, t.cid, t.organism, exp10(s.s1 / s.n), " +
+                      "s.s1 / s.n, CASE WHEN s.n > 1 THEN sqrt(MAX(0.0, (s.s2 - s.s1 * s.s1 / s.n) / (s.n - 1))) ELSE NULL END, " +
+                      "s.n, ? FROM imputation_target_temp t, " + from_clause + " WHERE " + where_clause, (source,))
+            c.execute("DELETE FROM imputation_target_temp WHERE EXISTS (SELECT 1 FROM " + imputed_table + " i " +
+                      "WHERE i.rid=imputation_target_temp.rid and i.side=imputation_target_temp.side and i.cid=imputation_target_temp.cid " + 
+                      "and i.organism IS imputation_target_temp.organism)")
+
+class ModuleBundle:
+    def __init__(self, comm, log_file=None):
+        """
+            Store all the data needed for each KEGG module (according to
+            kegg_mid_ec_rid) in a single row of kegg_module_bundle.
+            
+            The JSON of each (rid, ec) pair is generated only once, even if
+            it appears in several modules, and only the modules whose
+            digest has changed since the last run are written.
+        """
+        if (log_file != None):
+            self.LOG_FILE = log_file
+        else:
+            self.LOG_FILE = sys.stderr
+        
+        c = comm.cursor()
+        c.execute("CREATE TABLE IF NOT EXISTS kegg_module_bundle (mid INT, digest TEXT, bundle TEXT)")
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS mid_bundle_idx ON kegg_module_bundle (mid)")
+        comm.commit()
+
+        self.LOG_FILE.write("Generating the module bundles into kegg_module_bundle table ... ")
+        
+        rid_to_compounds = {}
+        for (rid, side, coeff, cid) in c.execute("SELECT rid, side, coefficient, cid FROM kegg_rid_to_cid " +
+                                                 "WHERE rid IN (SELECT rid FROM kegg_mid_ec_rid) ORDER BY rid, side, cid"):
+            rid_to_compounds.setdefault(rid, []).append([side, coeff, cid])
+        
+        rid_ec_to_params = {}
+        for (param_name, param_table) in [('km', 'merged_km'), ('kcat', 'merged_tn')]:
+            for (rid, ec, side, cid, organism, pubid, value) in c.execute("SELECT rid, ec, side, cid, organism, pubid, value FROM " + 
+                    param_table + " WHERE rid IN (SELECT rid FROM kegg_mid_ec_rid) ORDER BY rid, ec, side, cid, organism, pubid, value"):
+                rid_ec_to_params.setdefault((rid, ec, param_name), []).append([side, cid, organism, pubid, value])
+        
+        rid_to_priors = {}
+        for (param_name, imputed_table) in [('km_prior', 'imputed_km'), ('kcat_prior', 'imputed_tn')]:
+            for (rid, side, cid, value, log_std, source) in c.execute("SELECT rid, side, cid, value, log_std, source FROM " + 
+                    imputed_table + " WHERE organism IS NULL and rid IN (SELECT rid FROM kegg_mid_ec_rid) ORDER BY rid, side, cid"):
+                rid_to_priors.setdefault((rid, param_name), []).append([side, cid, value, log_std, source])
+        
+        mid_to_name = dict(c.execute("SELECT mid, name FROM kegg_module").fetchall())
+        mid_to_digest = dict(c.execute("SELECT mid, digest FROM kegg_module_bundle").fetchall())
+        
+        mid_to_rid_ec = {}
+        for (mid, rid, ec) in c.execute("SELECT DISTINCT mid, rid, ec FROM kegg_mid_ec_rid ORDER BY mid, rid, ec"):
+            mid_to_rid_ec.setdefault(mid, []).append((rid, ec))
+        
+        rid_ec_to_json = {}
+        counter = 0
+        for mid in sorted(mid_to_name.keys()):
+            reaction_json_list = []
+            for (rid, ec) in mid_to_rid_ec.get(mid, []):
+                if ((rid, ec) not in rid_ec_to_json):
+                    reaction = {'rid' : rid, 'ec' : ec, 'compounds' : rid_to_compounds.get(rid, [])}
+                    for param_name in ['km', 'kcat']:
+                        reaction[param_name] = rid_ec_to_params.get((rid, ec, param_name), [])
+                    for param_name in ['km_prior', 'kcat_prior']:
+                        reaction[param_name] = rid_to_priors.get((rid, param_name), [])
+                    rid_ec_to_json[(rid, ec)] = json.dumps(reaction, sort_keys=True)
+                reaction_json_list.append(rid_ec_to_json[(rid, ec)])
+            
+            bundle = '{"mid": %d, "name": %s, "reactions": [%s]}' % (mid, json.dumps(mid_to_name[mid]), ', '.join(reaction_json_list))
+            digest = hashlib.md5(bundle.encode('utf-8')).hexdigest()
+            if (mid_to_digest.get(mid) != digest):
+                c.execute("INSERT OR REPLACE INTO kegg_module_bundle VALUES(?,?,?)", (mid, digest, bundle))
+                counter += 1
+        
+        c.execute("DELETE FROM kegg_module_bundle WHERE mid NOT IN (SELECT mid FROM kegg_module)")
+        comm.commit()
+        c.close()
+        self.LOG_FILE.write("%d modules updated [DONE]\n" % counter)
+        
+    @staticmethod
+    def load(comm, mid):
+        """
+            Return the bundle of a KEGG module as a dictionary, or None if there is no such module.
+        """
+        c = comm.cursor()
+        row = c.execute("SELECT bundle FROM kegg_module_bundle WHERE mid=?", (mid,)).fetchone()
+        c.close()
+        if (row == None):
+            return None
+        return json.loads(row[0])
+
 ###################################################################################################
 #                                             MAIN                                                #
 ###################################################################################################
@@ -536,6 +948,17 @@ comm.commit()
 c.execute("DROP TABLE IF EXISTS merged_tn;")
 c.execute("CREATE TABLE merged_tn (rid INT, ec TEXT, side INT, cid INT, organism TEXT, pubid INT, value REAL);")
 c.execute("INSERT INTO merged_tn SELECT r2e.*, r2c.side, r2c.cid, k.organism, k.pubid, k.value FROM kegg_rid_to_cid r2c, kegg_rid_to_ec r2e, merged_tn_temp k where r2c.cid=k.cid and r2c.rid=r2e.rid and r2e.ec=k.ec;")
+comm.commit()
 
 c.close()
+
+# Validate the merged parameters:
+HALDANE = Haldane(comm)
+
+# Estimate the missing parameters:
+IMPUTATION = Imputation(comm)
+
+# Precompute the data of each module:
+BUNDLES = ModuleBundle(comm)
+
 comm.close()